@@ -2,8 +2,12 @@
 Generate .mem files from RISC-V assembly code.
 """
 
+import re
 import sys
-from typing import Dict, List, Literal
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Literal, Optional, Tuple, Union
+
+from preprocessor import preprocess_file
 
 
 class AssemblerError(RuntimeError):
@@ -63,197 +67,142 @@ registers: Dict[str, int] = {
 BitArray = List[Literal[0, 1]]
 
 
-# TODO: in hindsight it might have been better to use a dataclass
-RTypeFormat = Dict[Literal['opcode', 'funct3', 'funct7'], int]
-ITypeFormat = Dict[Literal['opcode', 'funct3'], int]
-ITypeSpecialFormat = Dict[Literal['opcode', 'funct3', 'imm'], int]
-STypeFormat = Dict[Literal['opcode', 'funct3'], int]
-BTypeFormat = Dict[Literal['opcode', 'funct3'], int]
-UTypeFormat = Dict[Literal['opcode'], int]
-JTypeFormat = Dict[Literal['opcode'], int]
-
-
-r_type_ops: Dict[str, RTypeFormat] = {
-    'add': {
-        'opcode': 0b0110011,
-        'funct3': 0b000,
-        'funct7': 0b0000000,
-    },
-    'sub': {
-        'opcode': 0b0110011,
-        'funct3': 0b000,
-        'funct7': 0b0100000,
-    },
-    'sll': {
-        'opcode': 0b0110011,
-        'funct3': 0b001,
-        'funct7': 0b0000000,
-    },
-    'slt': {
-        'opcode': 0b0110011,
-        'funct3': 0b010,
-        'funct7': 0b0000000,
-    },
-    'sltu': {
-        'opcode': 0b0110011,
-        'funct3': 0b011,
-        'funct7': 0b0000000,
-    },
-    'xor': {
-        'opcode': 0b0110011,
-        'funct3': 0b100,
-        'funct7': 0b0000000,
-    },
-    'srl': {
-        'opcode': 0b0110011,
-        'funct3': 0b101,
-        'funct7': 0b0000000,
-    },
-    'sra': {
-        'opcode': 0b0110011,
-        'funct3': 0b101,
-        'funct7': 0b0100000,
-    },
-    'or': {
-        'opcode': 0b0110011,
-        'funct3': 0b110,
-        'funct7': 0b0000000,
-    },
-    'and': {
-        'opcode': 0b0110011,
-        'funct3': 0b111,
-        'funct7': 0b0000000,
-    },
+@dataclass(frozen=True)
+class OpFormat:
+    '''
+    Encoding metadata for a single base instruction.
+
+    For the shift-immediate instructions (slli, srli, srai) `funct7` holds
+    the fixed upper 7 bits of the immediate field.
+    '''
+    fmt: Literal['r', 'i', 'i_special', 's', 'b', 'u', 'j']
+    opcode: int
+    funct3: int = 0
+    funct7: int = 0
+
+
+@dataclass(frozen=True, slots=True)
+class Instruction:
+    '''
+    Intermediate representation of a single base instruction.
+
+    The assembler produces these, the disassembler recovers them from machine
+    code and the simulator executes them. Registers are stored as their
+    index and `imm` is the signed immediate (for u-type it is the 20-bit
+    upper immediate, for b-type and j-type it is the byte offset). Register
+    numbers and immediates are range checked when the record is created.
+    '''
+    op: str
+    rd: int = 0
+    rs1: int = 0
+    rs2: int = 0
+    imm: int = 0
+
+    def __post_init__(self):
+        if self.op not in opcodes:
+            raise AssemblerError(f"'{self.op}' not recognized.")
+        for field in ('rd', 'rs1', 'rs2'):
+            if not 0 <= getattr(self, field) < 32:
+                raise RegisterError(f'{field}=x{getattr(self, field)} is not a valid RISC-V register.')
+
+        low, high, align = imm_ranges[opcodes[self.op].fmt]
+        if not low <= self.imm <= high or self.imm % align != 0:
+            expected = f'{low} to {high}' if align == 1 else f'a multiple of {align} from {low} to {high}'
+            raise AssemblerError(f"imm={self.imm} is out of range for '{self.op}' (expected {expected}).")
+
+    @property
+    def op_def(self) -> OpFormat:
+        return opcodes[self.op]
+
+
+# Valid immediates of each format as (lowest, highest, alignment). U-type
+# accepts the 20-bit upper immediate as either a signed or unsigned value.
+imm_ranges: Dict[str, Tuple[int, int, int]] = {
+    'r': (0, 0, 1),
+    'i': (-2**11, 2**11 - 1, 1),
+    'i_special': (0, 31, 1),
+    's': (-2**11, 2**11 - 1, 1),
+    'b': (-2**12, 2**12 - 2, 2),
+    'u': (-2**19, 2**20 - 1, 1),
+    'j': (-2**20, 2**20 - 2, 2),
 }
 
-i_type_ops: Dict[str, ITypeFormat] = {
-    'addi': {
-        'opcode': 0b0010011,
-        'funct3': 0b000,
-    },
-    'slti': {
-        'opcode': 0b0010011,
-        'funct3': 0b010,
-    },
-    'sltiu': {
-        'opcode': 0b0010011,
-        'funct3': 0b011,
-    },
-    'xori': {
-        'opcode': 0b0010011,
-        'funct3': 0b100,
-    },
-    'ori': {
-        'opcode': 0b0010011,
-        'funct3': 0b110,
-    },
-    'andi': {
-        'opcode': 0b0010011,
-        'funct3': 0b111,
-    },
-    'lb': {
-        'opcode': 0b0000011,
-        'funct3': 0b000,
-    },
-    'lh': {
-        'opcode': 0b0000011,
-        'funct3': 0b001,
-    },
-    'lw': {
-        'opcode': 0b0000011,
-        'funct3': 0b010,
-    },
-    'lbu': {
-        'opcode': 0b0000011,
-        'funct3': 0b100,
-    },
-    'lhu': {
-        'opcode': 0b0000011,
-        'funct3': 0b101,
-    },
-    'jalr': {
-        'opcode': 0b1100111,
-        'funct3': 0b000,
-    }
+
+r_type_ops: Dict[str, OpFormat] = {
+    'add':  OpFormat('r', 0b0110011, 0b000, 0b0000000),
+    'sub':  OpFormat('r', 0b0110011, 0b000, 0b0100000),
+    'sll':  OpFormat('r', 0b0110011, 0b001, 0b0000000),
+    'slt':  OpFormat('r', 0b0110011, 0b010, 0b0000000),
+    'sltu': OpFormat('r', 0b0110011, 0b011, 0b0000000),
+    'xor':  OpFormat('r', 0b0110011, 0b100, 0b0000000),
+    'srl':  OpFormat('r', 0b0110011, 0b101, 0b0000000),
+    'sra':  OpFormat('r', 0b0110011, 0b101, 0b0100000),
+    'or':   OpFormat('r', 0b0110011, 0b110, 0b0000000),
+    'and':  OpFormat('r', 0b0110011, 0b111, 0b0000000),
 }
 
-i_type_special_ops: Dict[str, ITypeSpecialFormat] = {
-    'slli': {
-        'opcode': 0b0010011,
-        'funct3': 0b001,
-        'imm': 0b0000000,
-    },
-    'srli': {
-        'opcode': 0b0010011,
-        'funct3': 0b101,
-        'imm': 0b0000000,
-    },
-    'srai': {
-        'opcode': 0b0010011,
-        'funct3': 0b101,
-        'imm': 0b0100000,
-    }
+i_type_ops: Dict[str, OpFormat] = {
+    'addi':  OpFormat('i', 0b0010011, 0b000),
+    'slti':  OpFormat('i', 0b0010011, 0b010),
+    'sltiu': OpFormat('i', 0b0010011, 0b011),
+    'xori':  OpFormat('i', 0b0010011, 0b100),
+    'ori':   OpFormat('i', 0b0010011, 0b110),
+    'andi':  OpFormat('i', 0b0010011, 0b111),
+    'lb':    OpFormat('i', 0b0000011, 0b000),
+    'lh':    OpFormat('i', 0b0000011, 0b001),
+    'lw':    OpFormat('i', 0b0000011, 0b010),
+    'lbu':   OpFormat('i', 0b0000011, 0b100),
+    'lhu':   OpFormat('i', 0b0000011, 0b101),
+    'jalr':  OpFormat('i', 0b1100111, 0b000),
 }
 
-s_type_ops: Dict[str, STypeFormat] = {
-    'sb': {
-        'opcode': 0b0100011,
-        'funct3': 0b000,
-    },
-    'sh': {
-        'opcode': 0b0100011,
-        'funct3': 0b001,
-    },
-    'sw': {
-        'opcode': 0b0100011,
-        'funct3': 0b010,
-    },
+i_type_special_ops: Dict[str, OpFormat] = {
+    'slli': OpFormat('i_special', 0b0010011, 0b001, 0b0000000),
+    'srli': OpFormat('i_special', 0b0010011, 0b101, 0b0000000),
+    'srai': OpFormat('i_special', 0b0010011, 0b101, 0b0100000),
 }
 
-b_type_ops: Dict[str, BTypeFormat] = {
-    'beq': {
-        'opcode': 0b1100011,
-        'funct3': 0b000,
-    },
-    'bne': {
-        'opcode': 0b1100011,
-        'funct3': 0b001,
-    },
-    'blt': {
-        'opcode': 0b1100011,
-        'funct3': 0b100,
-    },
-    'bge': {
-        'opcode': 0b1100011,
-        'funct3': 0b101,
-    },
-    'bltu': {
-        'opcode': 0b1100011,
-        'funct3': 0b110,
-    },
-    'bgeu': {
-        'opcode': 0b1100011,
-        'funct3': 0b111,
-    },
+s_type_ops: Dict[str, OpFormat] = {
+    'sb': OpFormat('s', 0b0100011, 0b000),
+    'sh': OpFormat('s', 0b0100011, 0b001),
+    'sw': OpFormat('s', 0b0100011, 0b010),
 }
 
-u_type_ops: Dict[str, UTypeFormat] = {
-    'lui': {
-        'opcode': 0b0110111,
-    },
-    'auipc': {
-        'opcode': 0b0010111,
-    },
+b_type_ops: Dict[str, OpFormat] = {
+    'beq':  OpFormat('b', 0b1100011, 0b000),
+    'bne':  OpFormat('b', 0b1100011, 0b001),
+    'blt':  OpFormat('b', 0b1100011, 0b100),
+    'bge':  OpFormat('b', 0b1100011, 0b101),
+    'bltu': OpFormat('b', 0b1100011, 0b110),
+    'bgeu': OpFormat('b', 0b1100011, 0b111),
 }
 
-j_type_ops: Dict[str, JTypeFormat] = {
-    'jal': {
-        'opcode': 0b1100011,
-    },
+u_type_ops: Dict[str, OpFormat] = {
+    'lui':   OpFormat('u', 0b0110111),
+    'auipc': OpFormat('u', 0b0010111),
+}
+
+j_type_ops: Dict[str, OpFormat] = {
+    'jal': OpFormat('j', 0b1101111),
+}
+
+# Loads share the i-type format but take their operands as `rd, offset(rs1)`
+load_ops: Tuple[str, ...] = tuple(k for k, v in i_type_ops.items() if v.opcode == 0b0000011)
+
+opcodes: Dict[str, OpFormat] = {
+    **r_type_ops,
+    **i_type_ops,
+    **i_type_special_ops,
+    **s_type_ops,
+    **b_type_ops,
+    **u_type_ops,
+    **j_type_ops,
 }
 
 
 def int_to_bit_array(i: int, size: int = None) -> BitArray:
+    if size is not None:
+        i &= (1 << size) - 1
     res = [int(digit) for digit in bin(i)[2:]]
     if size is not None:
         while len(res) < size:
@@ -261,283 +210,325 @@ def int_to_bit_array(i: int, size: int = None) -> BitArray:
     return res
 
 
+def bit_array_to_int(x: BitArray) -> int:
+    return int(''.join(str(d) for d in x), 2)
+
+
+def register_index(reg: str, field: str = 'register') -> int:
+    if reg not in registers:
+        raise RegisterError(f"{field}='{reg}' is not a valid RISC-V register.")
+    return registers[reg]
+
+
+def encode(inst: Instruction) -> int:
+    '''
+    Encode an instruction as a 32-bit machine word.
+    '''
+    op_def: OpFormat = inst.op_def
+    imm: int = inst.imm
+    res: int = op_def.opcode
+
+    if op_def.fmt == 'r':
+        res |= inst.rd << 7 | op_def.funct3 << 12 | inst.rs1 << 15 | inst.rs2 << 20 | op_def.funct7 << 25
+    elif op_def.fmt == 'i':
+        res |= inst.rd << 7 | op_def.funct3 << 12 | inst.rs1 << 15 | (imm & 0xfff) << 20
+    elif op_def.fmt == 'i_special':
+        res |= inst.rd << 7 | op_def.funct3 << 12 | inst.rs1 << 15 | (imm & 0x1f) << 20 | op_def.funct7 << 25
+    elif op_def.fmt == 's':
+        res |= (imm & 0x1f) << 7 | op_def.funct3 << 12 | inst.rs1 << 15 | inst.rs2 << 20 | (imm >> 5 & 0x7f) << 25
+    elif op_def.fmt == 'b':
+        res |= ((imm >> 11 & 0x1) << 7 | (imm >> 1 & 0xf) << 8 | op_def.funct3 << 12 | inst.rs1 << 15
+                | inst.rs2 << 20 | (imm >> 5 & 0x3f) << 25 | (imm >> 12 & 0x1) << 31)
+    elif op_def.fmt == 'u':
+        res |= inst.rd << 7 | (imm & 0xfffff) << 12
+    elif op_def.fmt == 'j':
+        res |= (inst.rd << 7 | (imm >> 12 & 0xff) << 12 | (imm >> 11 & 0x1) << 20
+                | (imm >> 1 & 0x3ff) << 21 | (imm >> 20 & 0x1) << 31)
+    else:
+        raise AssemblerError(f"'{op_def.fmt}' is not a valid instruction format.")
+
+    return res
+
+
+def sign_extend(val: int, bits: int) -> int:
+    sign_bit = 1 << (bits - 1)
+    return (val & (sign_bit - 1)) - (val & sign_bit)
+
+
+# Reverse lookup tables used by decode(). The shift-immediate and r-type
+# instructions need funct7 to be told apart, the rest only need funct3.
+_decode_funct7: Dict[Tuple[int, int, int], str] = {
+    (v.opcode, v.funct3, v.funct7): k for k, v in {**r_type_ops, **i_type_special_ops}.items()
+}
+_decode_funct3: Dict[Tuple[int, int], str] = {
+    (v.opcode, v.funct3): k for k, v in {**i_type_ops, **s_type_ops, **b_type_ops}.items()
+}
+_decode_opcode: Dict[int, str] = {
+    v.opcode: k for k, v in {**u_type_ops, **j_type_ops}.items()
+}
+
+
+def decode(word: int) -> Instruction:
+    '''
+    Decode a 32-bit machine word into an instruction.
+    '''
+    opcode: int = word & 0x7f
+    rd: int = word >> 7 & 0x1f
+    funct3: int = word >> 12 & 0x7
+    rs1: int = word >> 15 & 0x1f
+    rs2: int = word >> 20 & 0x1f
+    funct7: int = word >> 25 & 0x7f
+
+    op = _decode_funct7.get((opcode, funct3, funct7))
+    if op is None:
+        op = _decode_funct3.get((opcode, funct3))
+    if op is None:
+        op = _decode_opcode.get(opcode)
+    if op is None:
+        raise AssemblerError(f'0x{word:08x} is not a valid RV32I instruction.')
+
+    fmt = opcodes[op].fmt
+    if fmt == 'r':
+        return Instruction(op, rd, rs1, rs2)
+    elif fmt == 'i':
+        return Instruction(op, rd, rs1, imm=sign_extend(word >> 20, 12))
+    elif fmt == 'i_special':
+        return Instruction(op, rd, rs1, imm=rs2)
+    elif fmt == 's':
+        return Instruction(op, rs1=rs1, rs2=rs2, imm=sign_extend(funct7 << 5 | rd, 12))
+    elif fmt == 'b':
+        imm = (word >> 31 & 0x1) << 12 | (word >> 7 & 0x1) << 11 | (word >> 25 & 0x3f) << 5 | (word >> 8 & 0xf) << 1
+        return Instruction(op, rs1=rs1, rs2=rs2, imm=sign_extend(imm, 13))
+    elif fmt == 'u':
+        return Instruction(op, rd, imm=word >> 12 & 0xfffff)
+    else:
+        imm = (word >> 31 & 0x1) << 20 | (word >> 12 & 0xff) << 12 | (word >> 20 & 0x1) << 11 | (word >> 21 & 0x3ff) << 1
+        return Instruction(op, rd, imm=sign_extend(imm, 21))
+
+
 def build_r_type(op: str, rd: str, rs1: str, rs2: str) -> BitArray:
     if op not in r_type_ops:
         raise AssemblerError()
-    if rd not in registers:
-        raise RegisterError(f"rd='{rd}' is not a valid RISC-V register.")
-    if rs1 not in registers:
-        raise RegisterError(f"rs1='{rs1}' is not a valid RISC-V register.")
-    if rs2 not in registers:
-        raise RegisterError(f"rs2='{rs2}' is not a valid RISC-V register.")
-    
-    op_def: RTypeFormat = r_type_ops[op]
-    opcode: BitArray = int_to_bit_array(op_def['opcode'], size=7)
-    funct3: BitArray = int_to_bit_array(op_def['funct3'], size=3)
-    funct7: BitArray = int_to_bit_array(op_def['funct7'], size=7)
-    rd_val: BitArray = int_to_bit_array(registers[rd], size=5)
-    rs1_val: BitArray = int_to_bit_array(registers[rs1], size=5)
-    rs2_val: BitArray = int_to_bit_array(registers[rs2], size=5)
-
-    res = funct7 + rs2_val + rs1_val + funct3 + rd_val + opcode
-    assert len(res) == 32, f'len(res)={len(res)} (expected 32)'
-    
-    return res
+    inst = Instruction(op, register_index(rd, 'rd'), register_index(rs1, 'rs1'), register_index(rs2, 'rs2'))
+    return int_to_bit_array(encode(inst), 32)
 
 
 def build_i_type(op: str, rd: str, rs1: str, imm: int) -> BitArray:
     if op not in i_type_ops:
         raise AssemblerError()
-    if rd not in registers:
-        raise RegisterError(f"rd='{rd}' is not a valid RISC-V register.")
-    if rs1 not in registers:
-        raise RegisterError(f"rs1='{rs1}' is not a valid RISC-V register.")
-
-    op_def: ITypeFormat = i_type_ops[op]
-    opcode: BitArray = int_to_bit_array(op_def['opcode'], size=7)
-    funct3: BitArray = int_to_bit_array(op_def['funct3'], size=3)
-    rd_val: BitArray = int_to_bit_array(registers[rd], size=5)
-    rs1_val: BitArray = int_to_bit_array(registers[rs1], size=5)
-    imm_bits: BitArray = int_to_bit_array(imm, size=12)
-
-    res = imm_bits + rs1_val + funct3 + rd_val + opcode
-    assert len(res) == 32, f'len(res)={len(res)} (expected 32)'
-
-    return res
+    inst = Instruction(op, register_index(rd, 'rd'), register_index(rs1, 'rs1'), imm=imm)
+    return int_to_bit_array(encode(inst), 32)
 
 
 # TODO: test me
 def build_i_type_special(op: str, rd: str, rs1: str, sham: int) -> BitArray:
     if op not in i_type_special_ops:
         raise AssemblerError()
-    if rd not in registers:
-        raise RegisterError(f"rd='{rd}' is not a valid RISC-V register.")
-    if rs1 not in registers:
-        raise RegisterError(f"rs1='{rs1}' is not a valid RISC-V register.")
-
-    op_def: ITypeSpecialFormat = i_type_special_ops[op]
-    opcode: BitArray = int_to_bit_array(op_def['opcode'], 7)
-    funct3: BitArray = int_to_bit_array(op_def['funct3'], 3)
-    rd_val: BitArray = int_to_bit_array(registers[rd], size=5)
-    rs1_val: BitArray = int_to_bit_array(registers[rs1], size=5)
-    shamt_bits: BitArray = int_to_bit_array(sham, 5)
-    imm: BitArray = int_to_bit_array(op_def['imm'], 7)
-
-    res = imm + shamt_bits + rs1_val + funct3 + rd_val + opcode
-    assert len(res) == 32, f'len(res)={len(res)} (expected 32)'
-
-    return res
+    inst = Instruction(op, register_index(rd, 'rd'), register_index(rs1, 'rs1'), imm=sham)
+    return int_to_bit_array(encode(inst), 32)
 
 
-# TODO: test me
 def build_s_type(op: str, rs1: str, rs2: str, imm: int) -> BitArray:
     if op not in s_type_ops:
         raise AssemblerError()
-    if rs1 not in registers:
-        raise RegisterError(f"rd='{rs1}' is not a valid RISC-V register.")
-    if rs2 not in registers:
-        raise RegisterError(f"rs1='{rs2}' is not a valid RISC-V register.")
-    
-    op_def: STypeFormat = s_type_ops[op]
-    opcode: BitArray = int_to_bit_array(op_def['opcode'], 7)
-    funct3: BitArray = int_to_bit_array(op_def['funct3'], 3)
-    rs1_val: BitArray = int_to_bit_array(registers[rs1], 5)
-    rs2_val: BitArray = int_to_bit_array(registers[rs2], 5)
-    imm_bits: BitArray = int_to_bit_array(imm, 12)
-
-    res = imm_bits[5:11+1] + rs2_val + rs1_val + funct3 + imm_bits[0:4+1] + opcode
-    assert len(res) == 32, f'len(res)={len(res)} (expected 32)'
-
-    return res
+    inst = Instruction(op, rs1=register_index(rs1, 'rs1'), rs2=register_index(rs2, 'rs2'), imm=imm)
+    return int_to_bit_array(encode(inst), 32)
 
 
 # TODO: test me
 def build_b_type(op: str, rs1: str, rs2: str, imm: int) -> BitArray:
     if op not in b_type_ops:
         raise AssemblerError()
-    if rs1 not in registers:
-        raise RegisterError(f"rs1='{rs1}' is not a valid RISC-V register.")
-    if rs2 not in registers:
-        raise RegisterError(f"rs2='{rs2}' is not a valid RISC-V register.")
-    
-    op_def: BTypeFormat = b_type_ops[op]
-    opcode: BitArray = int_to_bit_array(op_def['opcode'], 7)
-    funct3: BitArray = int_to_bit_array(op_def['funct3'], 3)
-    rs1_val: BitArray = int_to_bit_array(registers[rs1], 5)
-    rs2_val: BitArray = int_to_bit_array(registers[rs2], 5)
-    imm_bits: BitArray = int_to_bit_array(imm, 13)
-
-    res = [imm_bits[12]] + imm_bits[5:10+1] + rs2_val + rs1_val + funct3 + imm_bits[1:4+1] + [imm_bits[11]] + opcode
-    assert len(res) == 32, f'len(res)={len(res)} (expected 32)'
-
-    return res
+    inst = Instruction(op, rs1=register_index(rs1, 'rs1'), rs2=register_index(rs2, 'rs2'), imm=imm)
+    return int_to_bit_array(encode(inst), 32)
 
 
 # TODO: test me
 def build_u_type(op: str, rd: str, imm: int) -> BitArray:
     if op not in u_type_ops:
         raise AssemblerError()
-    if rd not in registers:
-        raise RegisterError(f"rd='{rd}' is not a valid RISC-V register.")
-    
-    op_def: UTypeFormat = u_type_ops[op]
-    opcode: BitArray = int_to_bit_array(op_def['opcode'], 7)
-    rd_val: BitArray = int_to_bit_array(registers[rd], 5)
-    imm_bits: BitArray = int_to_bit_array(imm, 32)
-
-    res = imm_bits[12:31+1] + rd_val + opcode
-    assert len(res) == 32, f'len(res)={len(res)} (expected 32)'
-
-    return res
+    inst = Instruction(op, register_index(rd, 'rd'), imm=imm)
+    return int_to_bit_array(encode(inst), 32)
 
 
 def build_j_type(op: str, rd: str, imm: int) -> BitArray:
     if op not in j_type_ops:
         raise AssemblerError()
-    if rd not in registers:
-        raise RegisterError(f"rd='{rd}' is not a valid RISC-V register.")
+    inst = Instruction(op, register_index(rd, 'rd'), imm=imm)
+    return int_to_bit_array(encode(inst), 32)
+
+
+# Pseudo-instructions that expand to a single base instruction. Each entry
+# maps the operands of the pseudo-instruction onto (op, rd, rs1, rs2, imm) of
+# the base instruction, where operands are referenced by position.
+PseudoExpansion = Tuple[str, Optional[int], Optional[int], Optional[int], Union[int, str, None]]
+
+pseudo_ops: Dict[str, PseudoExpansion] = {
+    'nop':  ('addi', None, None, None, 0),
+    'mv':   ('addi', 0, 1, None, 0),
+    'not':  ('xori', 0, 1, None, -1),
+    'neg':  ('sub', 0, None, 1, None),
+    'seqz': ('sltiu', 0, 1, None, 1),
+    'snez': ('sltu', 0, None, 1, None),
+    'sltz': ('slt', 0, 1, None, None),
+    'sgtz': ('slt', 0, None, 1, None),
+    'beqz': ('beq', None, 0, None, 'o1'),
+    'bnez': ('bne', None, 0, None, 'o1'),
+    'blez': ('bge', None, None, 0, 'o1'),
+    'bgez': ('bge', None, 0, None, 'o1'),
+    'bltz': ('blt', None, 0, None, 'o1'),
+    'bgtz': ('blt', None, None, 0, 'o1'),
+    'bgt':  ('blt', None, 1, 0, 'o2'),
+    'ble':  ('bge', None, 1, 0, 'o2'),
+    'bgtu': ('bltu', None, 1, 0, 'o2'),
+    'bleu': ('bgeu', None, 1, 0, 'o2'),
+    'j':    ('jal', None, None, None, 'o0'),
+    'jr':   ('jalr', None, 0, None, 0),
+}
 
-    op_def: JTypeFormat = j_type_ops[op]
-    opcode: BitArray = int_to_bit_array(op_def['opcode'], 7)
-    rd_val: BitArray = int_to_bit_array(registers[rd], 5)
-    imm_bits: BitArray = int_to_bit_array(imm, 21)
 
-    res = [imm_bits[20]] + imm_bits[1:10+1] + [imm_bits[11]] + imm_bits[12:19+1] + rd_val + opcode
-    assert len(res) == 32, f'len(res)={len(res)} (expected 32)'
+def pseudo_arity(expansion: PseudoExpansion) -> int:
+    '''
+    Number of operands a pseudo-instruction takes, i.e. one more than the
+    highest operand position its expansion references.
+    '''
+    _, rd, rs1, rs2, imm = expansion
+    positions = [p for p in (rd, rs1, rs2) if p is not None]
+    if isinstance(imm, str):
+        positions.append(int(imm[1:]))
+    return max(positions, default=-1) + 1
 
-    return res
 
+def parse_imm(text: str) -> int:
+    '''
+    Parse an immediate. Decimal values may have leading zeros; hexadecimal,
+    binary and octal values need a 0x, 0b or 0o prefix.
+    '''
+    if text.lstrip('+-')[:2].lower() in ('0x', '0b', '0o'):
+        return int(text, 0)
+    return int(text)
 
-def bit_array_to_int(x: BitArray) -> int:
-    return int(''.join(str(d) for d in x), 2)
 
+_mem_operand_re = re.compile(r'^(.*)\((.+)\)$')
 
-if __name__ == "__main__":
-    fname_in = sys.argv[1]
-    fname_out = 'riscv.mem' if len(sys.argv) < 3 else sys.argv[2]
 
-    obj_code: List[BitArray] = []
-
-    with open(fname_in, encoding='utf-8') as f:
-        for lino, line in enumerate(f.readlines()):
-            # TODO: at some point I need to handle labels
-            op, instr = line.rstrip().split(' ', 1)
-            if op in r_type_ops:
-                rd, rs1, rs2 = instr.split(', ')
-                obj_code.append(build_r_type(op, rd, rs1, rs2))
-            elif op in i_type_ops:
-                rd, rs1, imm = instr.split(', ')
-                imm = int(imm)
-                obj_code.append(build_i_type(op, rd, rs1, imm))
-            elif op in i_type_special_ops:
-                raise NotImplementedError()
-            elif op in s_type_ops:
-                raise NotImplementedError('s-type instructions are not implemented yet.')
-            elif op in b_type_ops:
-                rs1, rs2, offset = instr.split(', ')
-                offset = int(offset)
-                obj_code.append(build_b_type(op, rs1, rs2, offset))
-            elif op in u_type_ops:
-                rd, imm = instr.split(', ')
-                imm = int(imm)
-                obj_code.append(build_u_type(op, rd, imm))
-            elif op in j_type_ops:
-                raise NotImplementedError('j-type instructions are not implemented yet.')
-            else:
-                # handle pseudo-instructions
-                if op == 'nop':
-                    obj_code.append(build_i_type('addi', 'x0', 'x0', 0))
-                elif op == 'li':
-                    # TODO: Implement this using some combination of lui + addi.
-                    #   The exact instructions needed will depend on the specific
-                    #   value of the immediate value being loaded.
-                    raise NotImplementedError('li is not implemented yet.')
-                elif op == 'mv':
-                    rd, rs = instr.split(', ')
-                    obj_code.append(build_i_type('addi', rd, rs, 0))
-                elif op == 'not':
-                    rd, rs = instr.split(', ')
-                    obj_code.append(build_i_type('xori', rd, rs, -1))
-                elif op == 'neg':
-                    rd, rs = instr.split(', ')
-                    obj_code.append(build_r_type('sub', rd, 'x0', rs))
-                elif op == 'negw':
-                    raise NotImplementedError('negw is not implemented yet.')
-                elif op == 'sext.w':
-                    raise NotImplementedError('sext.w is not implemented yet.')
-                elif op == 'seqz':
-                    rd, rs = instr.split(', ')
-                    obj_code.append(build_i_type('sltiu', rd, rs, 1))
-                elif op == 'snez':
-                    rd, rs = instr.split(', ')
-                    obj_code.append(build_r_type('sltu', rd, 'x0', rs))
-                elif op == 'sltz':
-                    rd, rs = instr.split(', ')
-                    obj_code.append(build_r_type('slt', rd, rs, 'x0'))
-                elif op == 'sgtz':
-                    rd, rs = instr.split(', ')
-                    obj_code.append(build_r_type('slt', rd, 'x0', rs))
-                elif op == 'beqz':
-                    rs, offset = instr.split(', ')
-                    obj_code.append(build_b_type('beq', rs, 'x0', offset))
-                elif op == 'bnez':
-                    rs, offset = instr.split(', ')
-                    obj_code.append(build_b_type('bne', rs, 'x0', offset))
-                elif op == 'blez':
-                    rs, offset = instr.split(', ')
-                    obj_code.append(build_b_type('bge', 'x0', rs, offset))
-                elif op == 'bgez':
-                    rs, offset = instr.split(', ')
-                    obj_code.append(build_b_type('bge', rs, 'x0', offset))
-                elif op == 'bltz':
-                    rs, offset = instr.split(', ')
-                    obj_code.append(build_b_type('blt', rs, 'x0', offset))
-                elif op == 'bgtz':
-                    rs, offset = instr.split(', ')
-                    obj_code.append(build_b_type('blt', 'x0', rs, offset))
-                elif op == 'bgt':
-                    rs, rt, offset = instr.split(', ')
-                    obj_code.append(build_b_type('blt', rt, rs, offset))
-                elif op == 'ble':
-                    rs, rt, offset = instr.split(', ')
-                    obj_code.append(build_b_type('bge', rt, rs, offset))
-                elif op == 'bgtu':
-                    rs, rt, offset = instr.split(', ')
-                    obj_code.append(build_b_type('bltu', rt, rs, offset))
-                elif op == 'bleu':
-                    rs, rt, offset = instr.split(', ')
-                    obj_code.append(build_b_type('bgeu', rt, rs, offset))
-                elif op == 'j':
-                    offset = instr
-                    obj_code.append(build_j_type('jal', 'x0', offset))
-                elif op == 'jal':
-                    raise NotImplementedError()
-                elif op == 'jr':
-                    rs = instr
-                    obj_code.append(build_i_type('jalr', 'x0', rs, 0))
-                elif op == 'jalr':
-                    raise NotImplementedError()
-                elif op == 'ret':
-                    obj_code.append(build_i_type('jalr', 'x0', 'x1', 0))
-                elif op == 'call':
-                    # TODO: implement
-                    # auipc x1, offset[31 : 12] + offset[11]
-                    # jalr x1, offset[11:0](x1)
-                    raise NotImplementedError('call is not implemented yet.')
-                elif op == 'tail':
-                    # TODO: implement
-                    # auipc x6, offset[31 : 12] + offset[11]
-                    # jalr x0, offset[11:0](x6)
-                    raise NotImplementedError('tail is not implemented yet.')
-                else:
-                    raise AssemblerError(f"'{instr[0]}' not recognized.")
+def parse_mem_operand(operand: str) -> Tuple[int, int]:
+    '''
+    Parse an `offset(rs1)` operand into (offset, rs1). The offset may be
+    omitted, in which case it is 0.
+    '''
+    m = _mem_operand_re.match(operand)
+    if m is None:
+        raise AssemblerError(f"'{operand}' is not of the form offset(rs1).")
+    offset = m.group(1).strip()
+    return (parse_imm(offset) if offset else 0), register_index(m.group(2).strip(), 'rs1')
+
+
+def parse_line(line: str) -> List[Instruction]:
+    '''
+    Parse a single line of assembly into zero or more instructions.
+    '''
+    line = line.split('#', 1)[0].strip()
+    if not line:
+        return []
+
+    parts = line.split(None, 1)
+    op = parts[0]
+    args: List[str] = [a.strip() for a in parts[1].split(',')] if len(parts) > 1 else []
+
+    try:
+        if op in r_type_ops:
+            rd, rs1, rs2 = args
+            return [Instruction(op, register_index(rd, 'rd'), register_index(rs1, 'rs1'), register_index(rs2, 'rs2'))]
+        elif op in load_ops:
+            rd, operand = args
+            imm, rs1 = parse_mem_operand(operand)
+            return [Instruction(op, register_index(rd, 'rd'), rs1, imm=imm)]
+        elif op in i_type_ops or op in i_type_special_ops:
+            rd, rs1, imm = args
+            return [Instruction(op, register_index(rd, 'rd'), register_index(rs1, 'rs1'), imm=parse_imm(imm))]
+        elif op in s_type_ops:
+            rs2, operand = args
+            imm, rs1 = parse_mem_operand(operand)
+            return [Instruction(op, rs1=rs1, rs2=register_index(rs2, 'rs2'), imm=imm)]
+        elif op in b_type_ops:
+            rs1, rs2, offset = args
+            return [Instruction(op, rs1=register_index(rs1, 'rs1'), rs2=register_index(rs2, 'rs2'), imm=parse_imm(offset))]
+        elif op in u_type_ops:
+            rd, imm = args
+            return [Instruction(op, register_index(rd, 'rd'), imm=parse_imm(imm))]
+        elif op in j_type_ops:
+            rd, offset = args
+            return [Instruction(op, register_index(rd, 'rd'), imm=parse_imm(offset))]
+        elif op in pseudo_ops:
+            if len(args) != pseudo_arity(pseudo_ops[op]):
+                raise ValueError(f'expected {pseudo_arity(pseudo_ops[op])} operands')
+            base, rd, rs1, rs2, imm = pseudo_ops[op]
+            if isinstance(imm, str):
+                imm = parse_imm(args[int(imm[1:])])
+            return [Instruction(
+                base,
+                0 if rd is None else register_index(args[rd], 'rd'),
+                0 if rs1 is None else register_index(args[rs1], 'rs1'),
+                0 if rs2 is None else register_index(args[rs2], 'rs2'),
+                imm,
+            )]
+        elif op == 'ret':
+            if args:
+                raise ValueError('ret takes no operands')
+            return [Instruction('jalr', 0, registers['ra'], imm=0)]
+        elif op == 'li':
+            # TODO: Implement this using some combination of lui + addi.
+            #   The exact instructions needed will depend on the specific
+            #   value of the immediate value being loaded.
+            raise NotImplementedError('li is not implemented yet.')
+        elif op in ('negw', 'sext.w'):
+            raise NotImplementedError(f'{op} is not implemented yet.')
+        elif op == 'call':
+            # TODO: implement
+            # auipc x1, offset[31 : 12] + offset[11]
+            # jalr x1, offset[11:0](x1)
+            raise NotImplementedError('call is not implemented yet.')
+        elif op == 'tail':
+            # TODO: implement
+            # auipc x6, offset[31 : 12] + offset[11]
+            # jalr x0, offset[11:0](x6)
+            raise NotImplementedError('tail is not implemented yet.')
+    except (ValueError, IndexError) as e:
+        raise AssemblerError(f"invalid operands for '{op}': '{line}'") from e
+
+    raise AssemblerError(f"'{op}' not recognized.")
+
+
+def assemble(lines: Iterable[str]) -> List[Instruction]:
+    '''
+    Parse assembly source into a list of instructions.
+    '''
+    program: List[Instruction] = []
+    for line in lines:
+        # TODO: at some point I need to handle labels
+        program.extend(parse_line(line))
+    return program
+
 
+def write_mem(fname_out: str, program: List[Instruction], size: int = 128) -> None:
+    '''
+    Write a program as a .mem file that can be loaded with $readmemh.
+    '''
+    words: List[int] = [encode(inst) for inst in program]
     # Instruction memory expects 128 instructions.
-    while len(obj_code) < 128:
-        obj_code.append([0 for _ in range(32)])
+    while len(words) < size:
+        words.append(0)
 
     with open(fname_out, 'w', encoding='utf-8') as wf:
-        for x in obj_code:
-            num = int(''.join(str(d) for d in x), 2)
-            s = f'{num:08x}'
-            wf.write(s+'\n')
+        for num in words:
+            wf.write(f'{num:08x}\n')
+
+
+if __name__ == "__main__":
+    fname_in = sys.argv[1]
+    fname_out = 'riscv.mem' if len(sys.argv) < 3 else sys.argv[2]
+
+    program: List[Instruction] = assemble(preprocess_file(fname_in))
+
+    write_mem(fname_out, program)
@@ -0,0 +1,230 @@
+"""
+Save and load snapshots of a simulated program's state.
+"""
+
+import hashlib
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+from assembler import Instruction, encode
+from memory import Cache, DataMemory
+
+
+CHECKPOINT_MAGIC: bytes = b'RVCK'
+CHECKPOINT_VERSION: int = 1
+
+_prefix = struct.Struct('<4sH')
+# program digest, pc, instructions retired, x0-x31
+_header = struct.Struct('<20sIQ32I')
+# memory size, page size, number of pages
+_memory = struct.Struct('<III')
+_page_index = struct.Struct('<I')
+# size, line size, ways, policy, hit latency, miss penalty, hits, misses, evictions
+_cache = struct.Struct('<IIIBIIQQQ')
+_count = struct.Struct('<I')
+
+_policies: Tuple[str, ...] = ('lru', 'fifo')
+
+
+class CheckpointError(RuntimeError):
+    '''
+    Error occurs when a checkpoint is malformed or does not match the memory
+    and cache configuration it is restored into.
+    '''
+    pass
+
+
+@dataclass(frozen=True)
+class CacheState:
+    size: int
+    line_size: int
+    ways: int
+    policy: str
+    hit_latency: int
+    miss_penalty: int
+    hits: int
+    misses: int
+    evictions: int
+    sets: Tuple[Tuple[int, ...], ...]
+
+
+@dataclass(frozen=True)
+class Checkpoint:
+    '''
+    Snapshot of the architectural state of a simulator. `pages` holds only
+    the non-zero pages of data memory and shares them with the simulator
+    the snapshot was taken from until either side writes to them.
+    '''
+    program_digest: bytes
+    pc: int
+    instret: int
+    x: Tuple[int, ...]
+    mem_size: int
+    page_size: int
+    pages: Dict[int, bytes]
+    cache: Optional[CacheState] = None
+
+
+def program_digest(program: List[Union[Instruction, int]]) -> bytes:
+    words = [inst if isinstance(inst, int) else encode(inst) for inst in program]
+    return hashlib.sha1(struct.pack(f'<{len(words)}I', *words)).digest()
+
+
+def save_cache(cache: Cache) -> CacheState:
+    return CacheState(
+        cache.size, cache.line_size, cache.ways, cache.policy, cache.hit_latency,
+        cache.miss_penalty, cache.hits, cache.misses, cache.evictions, cache.get_state(),
+    )
+
+
+def load_cache_state(cache: Cache, state: CacheState) -> None:
+    '''
+    Load the resident lines and statistics of `state` into `cache`. The cache
+    must have the same geometry and replacement policy; its latencies are
+    kept.
+    '''
+    expected = (state.size, state.line_size, state.ways, state.policy)
+    if (cache.size, cache.line_size, cache.ways, cache.policy) != expected:
+        raise CheckpointError(
+            f'checkpoint has a {state.size}B {state.ways}-way {state.policy} cache with '
+            f'{state.line_size}B lines, which does not match the configured '
+            f'{cache.size}B {cache.ways}-way {cache.policy} cache with {cache.line_size}B lines.'
+        )
+    try:
+        cache.set_state(state.sets)
+    except ValueError as e:
+        raise CheckpointError(f'cache in checkpoint is invalid: {e}') from e
+    cache.hits = state.hits
+    cache.misses = state.misses
+    cache.evictions = state.evictions
+
+
+def restore_cache(state: CacheState) -> Cache:
+    try:
+        cache = Cache(state.size, state.line_size, state.ways, state.policy, state.hit_latency, state.miss_penalty)
+    except ValueError as e:
+        raise CheckpointError(f'cache in checkpoint is invalid: {e}') from e
+    load_cache_state(cache, state)
+    return cache
+
+
+def load_memory_state(memory: DataMemory, ckpt: Checkpoint) -> None:
+    '''
+    Load the pages and cache state of `ckpt` into `memory`. The memory size
+    and cache geometry must match the checkpoint. A cache configured on
+    `memory` when the checkpoint has none starts out empty.
+    '''
+    if memory.size != ckpt.mem_size:
+        raise CheckpointError(
+            f'checkpoint has {ckpt.mem_size} bytes of data memory, but {memory.size} are configured.'
+        )
+    if ckpt.cache is not None:
+        if memory.cache is None:
+            raise CheckpointError('checkpoint has a data cache, but none is configured.')
+        load_cache_state(memory.cache, ckpt.cache)
+    elif memory.cache is not None:
+        memory.cache.set_state(((),) * memory.cache.num_sets)
+        memory.cache.reset_stats()
+    memory.page_size = ckpt.page_size
+    memory.pages = dict(ckpt.pages)
+
+
+def restore_memory(ckpt: Checkpoint) -> DataMemory:
+    '''
+    Build a data memory (and cache) configured the way the checkpoint was.
+    '''
+    cache = None if ckpt.cache is None else restore_cache(ckpt.cache)
+    memory = DataMemory(ckpt.mem_size, cache, ckpt.page_size)
+    memory.pages = dict(ckpt.pages)
+    return memory
+
+
+def dumps(ckpt: Checkpoint) -> bytes:
+    body: List[bytes] = [
+        _header.pack(ckpt.program_digest, ckpt.pc, ckpt.instret, *ckpt.x),
+        _memory.pack(ckpt.mem_size, ckpt.page_size, len(ckpt.pages)),
+    ]
+    for index in sorted(ckpt.pages):
+        body.append(_page_index.pack(index))
+        body.append(ckpt.pages[index])
+
+    cache = ckpt.cache
+    body.append(_count.pack(0 if cache is None else 1))
+    if cache is not None:
+        body.append(_cache.pack(
+            cache.size, cache.line_size, cache.ways, _policies.index(cache.policy),
+            cache.hit_latency, cache.miss_penalty, cache.hits, cache.misses, cache.evictions,
+        ))
+        for tags in cache.sets:
+            body.append(_count.pack(len(tags)))
+            body.append(struct.pack(f'<{len(tags)}I', *tags))
+
+    return _prefix.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION) + zlib.compress(b''.join(body))
+
+
+def loads(data: bytes) -> Checkpoint:
+    try:
+        magic, version = _prefix.unpack_from(data)
+        if magic != CHECKPOINT_MAGIC:
+            raise CheckpointError('not a checkpoint file.')
+        if version != CHECKPOINT_VERSION:
+            raise CheckpointError(f'checkpoint version {version} is not supported.')
+        body = zlib.decompress(data[_prefix.size:])
+
+        digest, pc, instret, *x = _header.unpack_from(body)
+        offset = _header.size
+        mem_size, page_size, num_pages = _memory.unpack_from(body, offset)
+        offset += _memory.size
+        if page_size < 4 or page_size & (page_size - 1):
+            raise CheckpointError(f'page_size={page_size} in checkpoint is invalid.')
+        pages: Dict[int, bytes] = {}
+        for _ in range(num_pages):
+            (index,) = _page_index.unpack_from(body, offset)
+            offset += _page_index.size
+            page = body[offset:offset + page_size]
+            if len(page) != page_size or index * page_size >= mem_size:
+                raise CheckpointError('checkpoint is truncated or corrupt.')
+            pages[index] = page
+            offset += page_size
+
+        (has_cache,) = _count.unpack_from(body, offset)
+        offset += _count.size
+        cache: Optional[CacheState] = None
+        if has_cache:
+            size, line_size, ways, policy, hit_latency, miss_penalty, hits, misses, evictions = \
+                _cache.unpack_from(body, offset)
+            offset += _cache.size
+            try:
+                Cache(size, line_size, ways, _policies[policy])
+            except ValueError as e:
+                raise CheckpointError(f'cache in checkpoint is invalid: {e}') from e
+            sets: List[Tuple[int, ...]] = []
+            for _ in range(size // (line_size * ways)):
+                (n,) = _count.unpack_from(body, offset)
+                offset += _count.size
+                if n > ways:
+                    raise CheckpointError(f'cache set in checkpoint holds {n} lines, but the cache is {ways}-way.')
+                sets.append(struct.unpack_from(f'<{n}I', body, offset))
+                offset += 4 * n
+            cache = CacheState(
+                size, line_size, ways, _policies[policy], hit_latency, miss_penalty,
+                hits, misses, evictions, tuple(sets),
+            )
+        if offset != len(body):
+            raise CheckpointError('checkpoint has trailing data.')
+    except (struct.error, zlib.error, IndexError, ZeroDivisionError) as e:
+        raise CheckpointError('checkpoint is truncated or corrupt.') from e
+
+    return Checkpoint(digest, pc, instret, tuple(x), mem_size, page_size, pages, cache)
+
+
+def save_checkpoint(ckpt: Checkpoint, fname: str) -> None:
+    with open(fname, 'wb') as f:
+        f.write(dumps(ckpt))
+
+
+def load_checkpoint(fname: str) -> Checkpoint:
+    with open(fname, 'rb') as f:
+        return loads(f.read())
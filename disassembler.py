@@ -0,0 +1,83 @@
+"""
+Generate RISC-V assembly code from .mem files.
+"""
+
+import sys
+from typing import List, Union
+
+from assembler import AssemblerError, Instruction, decode, load_ops
+
+
+# ABI name of each register, indexed by register number
+register_names: List[str] = [
+    'zero', 'ra', 'sp', 'gp', 'tp', 't0', 't1', 't2',
+    's0', 's1', 'a0', 'a1', 'a2', 'a3', 'a4', 'a5',
+    'a6', 'a7', 's2', 's3', 's4', 's5', 's6', 's7',
+    's8', 's9', 's10', 's11', 't3', 't4', 't5', 't6',
+]
+
+
+def format_instruction(inst: Instruction) -> str:
+    '''
+    Format an instruction using the same syntax accepted by the assembler.
+    '''
+    fmt = inst.op_def.fmt
+    rd = register_names[inst.rd]
+    rs1 = register_names[inst.rs1]
+    rs2 = register_names[inst.rs2]
+
+    if fmt == 'r':
+        return f'{inst.op} {rd}, {rs1}, {rs2}'
+    elif inst.op in load_ops:
+        return f'{inst.op} {rd}, {inst.imm}({rs1})'
+    elif fmt in ('i', 'i_special'):
+        return f'{inst.op} {rd}, {rs1}, {inst.imm}'
+    elif fmt == 's':
+        return f'{inst.op} {rs2}, {inst.imm}({rs1})'
+    elif fmt == 'b':
+        return f'{inst.op} {rs1}, {rs2}, {inst.imm}'
+    else:
+        return f'{inst.op} {rd}, {inst.imm}'
+
+
+def disassemble(words: List[int]) -> List[Instruction]:
+    '''
+    Decode machine words into instructions, ignoring the all-zero words used
+    to pad out the end of instruction memory.
+    '''
+    return [decode(word) for word in strip_padding(words)]
+
+
+def decode_words(words: List[int]) -> List[Union[Instruction, int]]:
+    '''
+    Like disassemble(), but words that are not valid instructions (such as
+    padding or data) are kept as ints rather than raising, so that running
+    the program only fails if one of them is actually executed.
+    '''
+    program: List[Union[Instruction, int]] = []
+    for word in strip_padding(words):
+        try:
+            program.append(decode(word))
+        except AssemblerError:
+            program.append(word)
+    return program
+
+
+def strip_padding(words: List[int]) -> List[int]:
+    end = len(words)
+    while end > 0 and words[end - 1] == 0:
+        end -= 1
+    return words[:end]
+
+
+def read_mem(fname: str) -> List[int]:
+    with open(fname, encoding='utf-8') as f:
+        return [int(line, 16) for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    for word in strip_padding(read_mem(sys.argv[1])):
+        try:
+            print(format_instruction(decode(word)))
+        except AssemblerError:
+            print(f'.word 0x{word:08x}')
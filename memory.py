@@ -0,0 +1,183 @@
+"""
+Data memory model with an optional set-associative cache simulator.
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, Literal, Optional, Tuple, Union
+
+
+class MemoryAccessError(RuntimeError):
+    '''
+    Error occurs when a load or store is out of range or misaligned.
+    '''
+    pass
+
+
+def is_power_of_two(n: int) -> bool:
+    return n > 0 and n & (n - 1) == 0
+
+
+class Cache:
+    '''
+    Set-associative cache that tracks which lines are resident but not their
+    contents. Stores are write-allocate, so loads and stores are counted the
+    same way.
+    '''
+
+    def __init__(
+        self,
+        size: int = 1024,
+        line_size: int = 16,
+        ways: int = 2,
+        policy: Literal['lru', 'fifo'] = 'lru',
+        hit_latency: int = 1,
+        miss_penalty: int = 10,
+    ):
+        if not (is_power_of_two(size) and is_power_of_two(line_size) and is_power_of_two(ways)):
+            raise ValueError('size, line_size and ways must be powers of two.')
+        if line_size < 4:
+            # A smaller line would split an aligned word access across lines.
+            raise ValueError(f'line_size={line_size} must be at least 4 bytes.')
+        if size < line_size * ways:
+            raise ValueError(f'a {size} byte cache cannot hold {ways} ways of {line_size} byte lines.')
+        if policy not in ('lru', 'fifo'):
+            raise ValueError(f"policy='{policy}' must be 'lru' or 'fifo'.")
+
+        self.size: int = size
+        self.line_size: int = line_size
+        self.ways: int = ways
+        self.policy: str = policy
+        self.hit_latency: int = hit_latency
+        self.miss_penalty: int = miss_penalty
+        self.num_sets: int = size // (line_size * ways)
+        # Each set maps resident tags to None, ordered from next victim to
+        # most recently inserted (fifo) or used (lru).
+        self.sets: List[OrderedDict] = [OrderedDict() for _ in range(self.num_sets)]
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def access(self, addr: int) -> bool:
+        '''
+        Record an access to `addr`. Returns True on a hit.
+        '''
+        line = addr // self.line_size
+        tags = self.sets[line % self.num_sets]
+        tag = line // self.num_sets
+
+        if tag in tags:
+            self.hits += 1
+            if self.policy == 'lru':
+                tags.move_to_end(tag)
+            return True
+
+        self.misses += 1
+        if len(tags) == self.ways:
+            tags.popitem(last=False)
+            self.evictions += 1
+        tags[tag] = None
+        return False
+
+    @property
+    def accesses(self) -> int:
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.accesses if self.accesses else 0.0
+
+    @property
+    def miss_penalty_cycles(self) -> int:
+        return self.misses * self.miss_penalty
+
+    @property
+    def cycles(self) -> int:
+        return self.accesses * self.hit_latency + self.miss_penalty_cycles
+
+    def get_state(self) -> Tuple[Tuple[int, ...], ...]:
+        '''
+        Return the resident tags of each set, in replacement order.
+        '''
+        return tuple(tuple(tags) for tags in self.sets)
+
+    def set_state(self, sets: Tuple[Tuple[int, ...], ...]) -> None:
+        if len(sets) != self.num_sets or any(len(tags) > self.ways for tags in sets):
+            raise ValueError('cache state does not match the cache geometry.')
+        self.sets = [OrderedDict.fromkeys(tags) for tags in sets]
+
+    def reset_stats(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def report(self) -> str:
+        return (
+            f'{self.size}B {self.ways}-way {self.policy} cache, {self.line_size}B lines: '
+            f'{self.accesses} accesses, {self.hits} hits, {self.misses} misses '
+            f'({self.hit_rate:.2%} hit rate), {self.miss_penalty_cycles} miss penalty cycles'
+        )
+
+
+class DataMemory:
+    '''
+    Byte-addressable little-endian data memory. Accesses must be naturally
+    aligned. If a cache is attached every access is passed through it.
+
+    Memory is stored as a map of fixed-size pages. Pages that have never been
+    written are absent and read as zero. Pages shared with a snapshot are
+    kept as immutable bytes and only copied the next time they are written.
+    '''
+
+    def __init__(self, size: int = 4096, cache: Optional[Cache] = None, page_size: int = 256):
+        if not is_power_of_two(page_size) or page_size < 4:
+            raise ValueError(f'page_size={page_size} must be a power of two of at least 4.')
+        self.size: int = size
+        self.page_size: int = page_size
+        self.pages: Dict[int, Union[bytes, bytearray]] = {}
+        self.cache: Optional[Cache] = cache
+
+    def _check(self, addr: int, width: int) -> None:
+        if width not in (1, 2, 4):
+            raise MemoryAccessError(f'width={width} must be 1, 2 or 4 bytes.')
+        if addr % width != 0:
+            raise MemoryAccessError(f'addr=0x{addr:08x} is not aligned to {width} bytes.')
+        if not 0 <= addr <= self.size - width:
+            raise MemoryAccessError(f'addr=0x{addr:08x} is outside of data memory.')
+        if self.cache is not None:
+            self.cache.access(addr)
+
+    def load(self, addr: int, width: int, signed: bool = False) -> int:
+        self._check(addr, width)
+        page = self.pages.get(addr // self.page_size)
+        if page is None:
+            return 0
+        offset = addr % self.page_size
+        return int.from_bytes(page[offset:offset + width], 'little', signed=signed)
+
+    def store(self, addr: int, width: int, value: int) -> None:
+        self._check(addr, width)
+        index = addr // self.page_size
+        page = self.pages.get(index)
+        if page is None:
+            page = self.pages[index] = bytearray(self.page_size)
+        elif isinstance(page, bytes):
+            page = self.pages[index] = bytearray(page)
+        offset = addr % self.page_size
+        page[offset:offset + width] = (value & ((1 << (8 * width)) - 1)).to_bytes(width, 'little')
+
+    def freeze(self) -> Dict[int, bytes]:
+        '''
+        Return the non-zero pages as immutable bytes. The returned pages are
+        shared with this memory until it next writes to them. Pages written
+        since the last call are copied, so this costs O(dirty pages x
+        page_size); clean pages are not copied again.
+        '''
+        frozen: Dict[int, bytes] = {}
+        for index, page in list(self.pages.items()):
+            if isinstance(page, bytearray):
+                if not any(page):
+                    del self.pages[index]
+                    continue
+                page = self.pages[index] = bytes(page)
+            frozen[index] = page
+        return frozen
@@ -0,0 +1,301 @@
+"""
+Expand assembler directives (.include, .macro, .equ, .rept) into plain
+RISC-V assembly code.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+class PreprocessorError(RuntimeError):
+    '''
+    Error occurs when a directive is malformed or cannot be expanded.
+    '''
+    pass
+
+
+@dataclass(frozen=True)
+class Macro:
+    name: str
+    params: Tuple[str, ...]
+    body: Tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class CachedFile:
+    mtime_ns: int
+    size: int
+    digest: str
+    lines: Tuple[str, ...]
+
+
+# Included files keyed by absolute path. Entries are reused as long as the
+# file's mtime and size are unchanged, or its contents hash the same.
+_file_cache: Dict[str, CachedFile] = {}
+
+# Entries of _file_cache are also written here so that later processes (one
+# per assembled source) can reuse them. Set to None to disable.
+cache_dir: Optional[str] = os.environ.get(
+    'RISCV_PREPROCESSOR_CACHE',
+    os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser(os.path.join('~', '.cache'))),
+                 'riscv-preprocessor'),
+) or None
+
+_symbol_re = re.compile(r'\b[A-Za-z_][A-Za-z0-9_]*\b')
+_param_re = re.compile(r'\\([A-Za-z_][A-Za-z0-9_]*)')
+
+
+def clean_line(line: str) -> str:
+    return line.split('#', 1)[0].strip()
+
+
+def clean_lines(lines: Iterable[str]) -> Tuple[str, ...]:
+    '''
+    Remove comments, surrounding whitespace and blank lines.
+    '''
+    return tuple(cleaned for cleaned in (clean_line(line) for line in lines) if cleaned)
+
+
+def _disk_cache_path(path: str) -> Optional[str]:
+    if cache_dir is None:
+        return None
+    return os.path.join(cache_dir, hashlib.sha1(path.encode('utf-8')).hexdigest() + '.json')
+
+
+def _read_disk_cache(path: str) -> Optional[CachedFile]:
+    fname = _disk_cache_path(path)
+    if fname is None:
+        return None
+    try:
+        with open(fname, encoding='utf-8') as f:
+            entry = json.load(f)
+        return CachedFile(entry['mtime_ns'], entry['size'], entry['digest'], tuple(entry['lines']))
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _write_disk_cache(path: str, entry: CachedFile) -> None:
+    # The disk cache is only an optimization, so failing to write it is not
+    # an error.
+    fname = _disk_cache_path(path)
+    if fname is None:
+        return
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f'{fname}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(asdict(entry), f)
+        os.replace(tmp, fname)
+    except OSError:
+        pass
+
+
+def read_source(fname: str) -> Tuple[str, ...]:
+    '''
+    Read a source file with comments and blank lines removed, reusing the
+    cached copy (in memory or on disk) when the file has not changed.
+    '''
+    path = os.path.abspath(fname)
+    try:
+        st = os.stat(path)
+    except OSError as e:
+        raise PreprocessorError(f"cannot read '{fname}': {e.strerror}") from e
+
+    cached: Optional[CachedFile] = _file_cache.get(path)
+    if cached is None:
+        cached = _read_disk_cache(path)
+    if cached is not None and cached.mtime_ns == st.st_mtime_ns and cached.size == st.st_size:
+        _file_cache[path] = cached
+        return cached.lines
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha1(data).hexdigest()
+    if cached is not None and cached.digest == digest:
+        lines = cached.lines
+    else:
+        lines = clean_lines(data.decode('utf-8').splitlines())
+    entry = CachedFile(st.st_mtime_ns, st.st_size, digest, lines)
+    _file_cache[path] = entry
+    _write_disk_cache(path, entry)
+    return lines
+
+
+def split_args(text: str) -> List[str]:
+    return [a.strip() for a in text.split(',')] if text.strip() else []
+
+
+class Preprocessor:
+    '''
+    Expands directives into a flat list of assembly lines.
+
+    Expanded macro invocations are memoized by macro name, arguments and the
+    directory .include is resolved against. The memo is discarded whenever a
+    symbol or macro is (re)defined, since either can change what an
+    expansion produces.
+    '''
+
+    def __init__(self):
+        self.symbols: Dict[str, str] = {}
+        self.macros: Dict[str, Macro] = {}
+        self._expansions: Dict[Tuple[str, Tuple[str, ...], str], Tuple[str, ...]] = {}
+        self._generation: int = 0
+        self._include_stack: List[str] = []
+        self._macro_stack: List[str] = []
+
+    def _redefined(self) -> None:
+        self._expansions.clear()
+        self._generation += 1
+
+    def substitute(self, line: str) -> str:
+        if not self.symbols:
+            return line
+        return _symbol_re.sub(lambda m: self.symbols.get(m.group(0), m.group(0)), line)
+
+    def process_file(self, fname: str) -> List[str]:
+        path = os.path.abspath(fname)
+        if path in self._include_stack:
+            raise PreprocessorError(f"'{fname}' includes itself.")
+        self._include_stack.append(path)
+        try:
+            out: List[str] = []
+            self._process(read_source(path), out, os.path.dirname(path))
+            return out
+        finally:
+            self._include_stack.pop()
+
+    def process(self, lines: Iterable[str], out: List[str], base_dir: str = '.') -> None:
+        '''
+        Expand `lines`, appending the result to `out`.
+        '''
+        self._process(clean_lines(lines), out, base_dir)
+
+    def _process(self, lines: Sequence[str], out: List[str], base_dir: str) -> None:
+        # `lines` must already have been through clean_lines(). Macro and
+        # .rept bodies are slices of such lines, so they are passed through
+        # here without being cleaned again.
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            i += 1
+            parts = line.split(None, 1)
+            directive = parts[0]
+            rest = parts[1] if len(parts) > 1 else ''
+
+            if directive == '.include':
+                fname = rest.strip().strip('"')
+                if not fname:
+                    raise PreprocessorError('.include requires a file name.')
+                out.extend(self.process_file(os.path.join(base_dir, fname)))
+            elif directive == '.equ':
+                args = split_args(rest)
+                if len(args) != 2 or not _symbol_re.fullmatch(args[0]):
+                    raise PreprocessorError(f"invalid .equ: '{line}'")
+                self.symbols[args[0]] = self.substitute(args[1])
+                self._redefined()
+            elif directive == '.macro':
+                header = rest.split(None, 1)
+                if not header:
+                    raise PreprocessorError('.macro requires a name.')
+                body, i = self._collect_block(lines, i, '.macro', '.endm')
+                params = tuple(split_args(header[1])) if len(header) > 1 else ()
+                self.macros[header[0]] = Macro(header[0], params, tuple(body))
+                self._redefined()
+            elif directive == '.rept':
+                try:
+                    count = int(self.substitute(rest), 0)
+                except ValueError as e:
+                    raise PreprocessorError(f"invalid .rept count: '{line}'") from e
+                body, i = self._collect_block(lines, i, '.rept', '.endr')
+                self._repeat(body, count, out, base_dir)
+            elif directive in ('.endm', '.endr'):
+                raise PreprocessorError(f"'{directive}' without a matching block.")
+            elif directive in self.macros:
+                out.extend(self.expand(directive, tuple(split_args(self.substitute(rest))), base_dir))
+            else:
+                out.append(self.substitute(line))
+
+    def _collect_block(self, lines: Sequence[str], i: int, start: str, end: str) -> Tuple[List[str], int]:
+        '''
+        Collect the lines up to the `end` directive matching the block that
+        was opened just before line `i`.
+        '''
+        depth = 1
+        body: List[str] = []
+        while i < len(lines):
+            directive = lines[i].split(None, 1)[0]
+            i += 1
+            if directive == start:
+                depth += 1
+            elif directive == end:
+                depth -= 1
+                if depth == 0:
+                    return body, i
+            body.append(lines[i - 1])
+        raise PreprocessorError(f"'{start}' without a matching '{end}'.")
+
+    def _repeat(self, body: List[str], count: int, out: List[str], base_dir: str) -> None:
+        # Expand the body once and copy it, unless expanding it defined
+        # something that could make the next iteration expand differently.
+        if count <= 0:
+            return
+        generation = self._generation
+        expanded: List[str] = []
+        self._process(body, expanded, base_dir)
+        if self._generation == generation:
+            out.extend(expanded * count)
+            return
+        out.extend(expanded)
+        for _ in range(count - 1):
+            self._process(body, out, base_dir)
+
+    def expand(self, name: str, args: Tuple[str, ...], base_dir: str = '.') -> Tuple[str, ...]:
+        '''
+        Expand a macro invocation.
+        '''
+        key = (name, args, base_dir)
+        cached = self._expansions.get(key)
+        if cached is not None:
+            return cached
+
+        if name in self._macro_stack:
+            raise PreprocessorError(f"macro '{name}' expands to itself.")
+        macro: Macro = self.macros[name]
+        if len(args) != len(macro.params):
+            raise PreprocessorError(
+                f"macro '{name}' expects {len(macro.params)} arguments, got {len(args)}."
+            )
+        values = dict(zip(macro.params, args))
+
+        def replace(m: re.Match) -> str:
+            if m.group(1) not in values:
+                raise PreprocessorError(f"'\\{m.group(1)}' is not a parameter of macro '{name}'.")
+            return values[m.group(1)]
+
+        generation = self._generation
+        expanded: List[str] = []
+        self._macro_stack.append(name)
+        try:
+            # Arguments may be empty, so a body line can end up blank.
+            body = [_param_re.sub(replace, line).strip() for line in macro.body]
+            self._process([line for line in body if line], expanded, base_dir)
+        finally:
+            self._macro_stack.pop()
+        result = tuple(expanded)
+        if self._generation == generation:
+            self._expansions[key] = result
+        return result
+
+
+def preprocess_file(fname: str) -> List[str]:
+    return Preprocessor().process_file(fname)
+
+
+if __name__ == "__main__":
+    for line in preprocess_file(sys.argv[1]):
+        print(line)
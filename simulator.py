@@ -0,0 +1,350 @@
+"""
+Functional model of the core that executes assembled or disassembled programs.
+"""
+
+import argparse
+from typing import List, Optional, Union
+
+from assembler import AssemblerError, Instruction, assemble
+from checkpoint import (
+    Checkpoint, CheckpointError, load_checkpoint, load_memory_state, program_digest, restore_cache,
+    restore_memory, save_cache, save_checkpoint,
+)
+from preprocessor import PreprocessorError, preprocess_file
+from disassembler import decode_words, read_mem
+from memory import Cache, DataMemory, MemoryAccessError
+
+
+MASK: int = 0xffffffff
+
+# Instructions, or raw words that did not decode (see decode_words())
+Program = List[Union[Instruction, int]]
+
+
+class SimulatorError(RuntimeError):
+    '''
+    Generic runtime error from the simulator.
+    '''
+    pass
+
+
+def to_signed(val: int) -> int:
+    return val - (1 << 32) if val & 0x80000000 else val
+
+
+class Simulator:
+    '''
+    Executes a program one instruction at a time. Register values are kept as
+    unsigned 32-bit integers.
+    '''
+
+    def __init__(self, program: Program, memory: Optional[DataMemory] = None):
+        self.program: Program = program
+        self.memory: DataMemory = DataMemory() if memory is None else memory
+        self.pc: int = 0
+        self.x: List[int] = [0] * 32
+        self.instret: int = 0
+        self.reset()
+
+    def reset(self) -> None:
+        # Mirrors register_file.v, which resets every register to its index.
+        self.pc = 0
+        self.instret = 0
+        self.x = list(range(32))
+        self.x[0] = 0
+
+    def checkpoint(self) -> Checkpoint:
+        '''
+        Snapshot the current state. Memory pages written since the last
+        snapshot are copied once; all others are shared with it.
+        '''
+        cache = self.memory.cache
+        return Checkpoint(
+            program_digest(self.program), self.pc, self.instret, tuple(self.x),
+            self.memory.size, self.memory.page_size, self.memory.freeze(),
+            None if cache is None else save_cache(cache),
+        )
+
+    def restore(self, ckpt: Checkpoint) -> None:
+        '''
+        Restore a snapshot taken from a simulator running the same program.
+        The simulator keeps its own data memory and cache configuration and
+        raises CheckpointError if the snapshot does not fit it.
+        '''
+        if ckpt.program_digest != program_digest(self.program):
+            raise SimulatorError('checkpoint was taken from a different program.')
+        load_memory_state(self.memory, ckpt)
+        self.pc = ckpt.pc
+        self.instret = ckpt.instret
+        self.x = list(ckpt.x)
+
+    @property
+    def done(self) -> bool:
+        return not 0 <= self.pc < 4 * len(self.program)
+
+    def step(self) -> None:
+        if self.pc % 4 != 0:
+            raise SimulatorError(f'pc=0x{self.pc:x} is not aligned.')
+        if self.done:
+            raise SimulatorError(f'pc=0x{self.pc:x} is outside of the program.')
+
+        inst: Union[Instruction, int] = self.program[self.pc // 4]
+        if isinstance(inst, int):
+            if inst != 0:
+                raise SimulatorError(f'0x{inst:08x} at pc=0x{self.pc:x} is not a valid RV32I instruction.')
+            # decode.v treats the all-zero word (like anything that is not
+            # r-type) as a nop.
+            self.pc = (self.pc + 4) & MASK
+            self.instret += 1
+            return
+        op: str = inst.op
+        x: List[int] = self.x
+        rs1: int = x[inst.rs1]
+        rs2: int = x[inst.rs2]
+        imm: int = inst.imm
+        next_pc: int = self.pc + 4
+        res: Optional[int] = None
+
+        if op == 'add':
+            res = rs1 + rs2
+        elif op == 'sub':
+            res = rs1 - rs2
+        elif op == 'sll':
+            res = rs1 << (rs2 & 0x1f)
+        elif op == 'slt':
+            res = int(to_signed(rs1) < to_signed(rs2))
+        elif op == 'sltu':
+            res = int(rs1 < rs2)
+        elif op == 'xor':
+            res = rs1 ^ rs2
+        elif op == 'srl':
+            res = rs1 >> (rs2 & 0x1f)
+        elif op == 'sra':
+            res = to_signed(rs1) >> (rs2 & 0x1f)
+        elif op == 'or':
+            res = rs1 | rs2
+        elif op == 'and':
+            res = rs1 & rs2
+        elif op == 'addi':
+            res = rs1 + imm
+        elif op == 'slti':
+            res = int(to_signed(rs1) < imm)
+        elif op == 'sltiu':
+            res = int(rs1 < (imm & MASK))
+        elif op == 'xori':
+            res = rs1 ^ imm
+        elif op == 'ori':
+            res = rs1 | imm
+        elif op == 'andi':
+            res = rs1 & imm
+        elif op == 'slli':
+            res = rs1 << imm
+        elif op == 'srli':
+            res = rs1 >> imm
+        elif op == 'srai':
+            res = to_signed(rs1) >> imm
+        elif op == 'lui':
+            res = imm << 12
+        elif op == 'auipc':
+            res = self.pc + (imm << 12)
+        elif op == 'jal':
+            res = next_pc
+            next_pc = self.pc + imm
+        elif op == 'jalr':
+            res = next_pc
+            next_pc = (rs1 + imm) & ~1
+        elif op == 'beq':
+            if rs1 == rs2:
+                next_pc = self.pc + imm
+        elif op == 'bne':
+            if rs1 != rs2:
+                next_pc = self.pc + imm
+        elif op == 'blt':
+            if to_signed(rs1) < to_signed(rs2):
+                next_pc = self.pc + imm
+        elif op == 'bge':
+            if to_signed(rs1) >= to_signed(rs2):
+                next_pc = self.pc + imm
+        elif op == 'bltu':
+            if rs1 < rs2:
+                next_pc = self.pc + imm
+        elif op == 'bgeu':
+            if rs1 >= rs2:
+                next_pc = self.pc + imm
+        elif op == 'lb':
+            res = self.memory.load((rs1 + imm) & MASK, 1, signed=True)
+        elif op == 'lh':
+            res = self.memory.load((rs1 + imm) & MASK, 2, signed=True)
+        elif op == 'lw':
+            res = self.memory.load((rs1 + imm) & MASK, 4)
+        elif op == 'lbu':
+            res = self.memory.load((rs1 + imm) & MASK, 1)
+        elif op == 'lhu':
+            res = self.memory.load((rs1 + imm) & MASK, 2)
+        elif op == 'sb':
+            self.memory.store((rs1 + imm) & MASK, 1, rs2)
+        elif op == 'sh':
+            self.memory.store((rs1 + imm) & MASK, 2, rs2)
+        elif op == 'sw':
+            self.memory.store((rs1 + imm) & MASK, 4, rs2)
+        else:
+            raise SimulatorError(f"'{op}' not recognized.")
+
+        if res is not None and inst.rd != 0:
+            x[inst.rd] = res & MASK
+        self.pc = next_pc & MASK
+        self.instret += 1
+
+    def run(self, max_steps: Optional[int] = None) -> int:
+        '''
+        Run until the pc leaves the program or `max_steps` instructions have
+        been executed. Returns the number of instructions executed.
+        '''
+        steps: int = 0
+        while not self.done and (max_steps is None or steps < max_steps):
+            self.step()
+            steps += 1
+        return steps
+
+
+class CycleSimulator(Simulator):
+    '''
+    Simulator that also counts clock cycles. Every instruction spends one
+    cycle in each stage of riscv_internal.v (program counter, instruction
+    memory, decode, register file and ALU), and loads and stores add the
+    latency of the data cache when one is attached.
+    '''
+
+    stage_cycles: int = 5
+
+    def reset(self) -> None:
+        super().reset()
+        self.cycles: int = 0
+
+    def step(self) -> None:
+        cache: Optional[Cache] = self.memory.cache
+        before: int = 0 if cache is None else cache.cycles
+        super().step()
+        self.cycles += self.stage_cycles + (0 if cache is None else cache.cycles - before)
+
+
+def fast_forward(
+    program: Program,
+    n: int,
+    memory: Optional[DataMemory] = None,
+    start: Optional[Checkpoint] = None,
+) -> CycleSimulator:
+    '''
+    Execute functionally until `n` instructions have been retired (from reset,
+    or from `start` if given), then hand the state to a CycleSimulator for
+    detailed timing. `memory` defaults to the configuration of `start`. The
+    cache stays warm across the hand-off but its statistics are reset.
+    '''
+    if memory is None and start is not None:
+        memory = restore_memory(start)
+    functional = Simulator(program, memory)
+    if start is not None:
+        functional.restore(start)
+    functional.run(max_steps=max(n - functional.instret, 0))
+    ckpt = functional.checkpoint()
+    detailed = CycleSimulator(program, restore_memory(ckpt))
+    detailed.restore(ckpt)
+    if detailed.memory.cache is not None:
+        detailed.memory.cache.reset_stats()
+    return detailed
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('fname_in', help='assembly (.s) or machine code (.mem) file')
+    parser.add_argument('--mem-size', type=int,
+                        help='data memory size in bytes (default: 4096, or the size saved in --restore)')
+    parser.add_argument('--cache', type=int, nargs=3, metavar=('SIZE', 'LINE_SIZE', 'WAYS'),
+                        help='simulate a set-associative data cache')
+    parser.add_argument('--policy', choices=('lru', 'fifo'),
+                        help='cache replacement policy (default: lru, or the policy saved in --restore)')
+    parser.add_argument('--miss-penalty', type=int,
+                        help='cycles added by each cache miss (default: 10, or the value saved in --restore)')
+    parser.add_argument('--max-steps', type=int, help='stop after executing this many instructions')
+    parser.add_argument('--restore', metavar='FILE', help='start from a saved checkpoint instead of reset')
+    parser.add_argument('--save', metavar='FILE', help='save a checkpoint when the run stops')
+    parser.add_argument('--fast-forward', type=int, metavar='N',
+                        help='run functionally to instruction N, then count cycles from there on')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.fname_in.endswith('.mem'):
+            program: Program = decode_words(read_mem(args.fname_in))
+        else:
+            program = assemble(preprocess_file(args.fname_in))
+    except (AssemblerError, PreprocessorError) as e:
+        parser.error(str(e))
+
+    start: Optional[Checkpoint] = None
+    if args.restore is not None:
+        try:
+            start = load_checkpoint(args.restore)
+        except (OSError, CheckpointError) as e:
+            parser.error(f'--restore: {e}')
+
+    # Options that are not given default to the checkpoint's configuration.
+    # Options that conflict with it are rejected when it is restored.
+    cache: Optional[Cache] = None
+    if args.cache is not None:
+        size, line_size, ways = args.cache
+        try:
+            cache = Cache(
+                size, line_size, ways,
+                'lru' if args.policy is None else args.policy,
+                miss_penalty=10 if args.miss_penalty is None else args.miss_penalty,
+            )
+        except ValueError as e:
+            parser.error(f'--cache: {e}')
+    elif start is not None and start.cache is not None:
+        if args.policy is not None and args.policy != start.cache.policy:
+            parser.error(f"--policy {args.policy} conflicts with the checkpoint's {start.cache.policy} cache.")
+        try:
+            cache = restore_cache(start.cache)
+        except CheckpointError as e:
+            parser.error(f'--restore: {e}')
+        # Latencies are not part of the cache state, so they can be changed.
+        if args.miss_penalty is not None:
+            cache.miss_penalty = args.miss_penalty
+    elif args.policy is not None or args.miss_penalty is not None:
+        parser.error('--policy and --miss-penalty need a data cache (--cache).')
+    mem_size: int = args.mem_size
+    if mem_size is None:
+        mem_size = 4096 if start is None else start.mem_size
+
+    memory = DataMemory(mem_size, cache)
+    try:
+        if args.fast_forward is not None:
+            sim: Simulator = fast_forward(program, args.fast_forward, memory, start)
+        else:
+            sim = Simulator(program, memory)
+            if start is not None:
+                sim.restore(start)
+    except (CheckpointError, SimulatorError) as e:
+        parser.error(str(e))
+
+    try:
+        steps = sim.run(args.max_steps)
+    except SimulatorError as e:
+        parser.error(str(e))
+    except MemoryAccessError as e:
+        # The pc is only advanced once an instruction completes, so it still
+        # points at the faulting load or store.
+        parser.error(f'pc=0x{sim.pc:08x}: {e}')
+    print(f'executed {steps} instructions ({sim.instret} total), pc=0x{sim.pc:08x}')
+    if isinstance(sim, CycleSimulator):
+        print(f'{sim.cycles} cycles')
+    for i in range(32):
+        print(f'x{i:<2} = 0x{sim.x[i]:08x}')
+    if sim.memory.cache is not None:
+        print(sim.memory.cache.report())
+    if args.save is not None:
+        save_checkpoint(sim.checkpoint(), args.save)
+
+
+if __name__ == "__main__":
+    main()
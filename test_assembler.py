@@ -0,0 +1,18 @@
+import pytest
+
+from assembler import *
+
+
+def test_parse_imm():
+    assert parse_line('addi t0, t1, 010') == [Instruction('addi', 5, 6, imm=10)]
+    assert parse_line('addi t0, t1, -0x10') == [Instruction('addi', 5, 6, imm=-16)]
+    assert parse_line('lw t0, 0b100(sp)') == [Instruction('lw', 5, 2, imm=4)]
+
+
+def test_parse_pseudo_operands():
+    assert parse_line('nop') == [Instruction('addi')]
+    assert parse_line('ret') == [Instruction('jalr', rs1=1)]
+    assert parse_line('bgt a0, a1, 8') == [Instruction('blt', rs1=11, rs2=10, imm=8)]
+    for line in ('nop ra', 'ret ra', 'mv a0', 'mv a0, a1, a2', 'j 8, 8'):
+        with pytest.raises(AssemblerError):
+            parse_line(line)
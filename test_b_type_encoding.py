@@ -26,3 +26,12 @@ def test_enc_rv32i_bltu():
 
 def test_enc_rv32i_bgeu():
     pass
+
+
+def test_enc_rv32i_b_imm_range():
+    build_b_type('beq', 'ra', 'sp', -4096)
+    build_b_type('beq', 'ra', 'sp', 4094)
+    with pytest.raises(AssemblerError):
+        build_b_type('beq', 'ra', 'sp', 3)
+    with pytest.raises(AssemblerError):
+        build_b_type('beq', 'ra', 'sp', 4096)
@@ -0,0 +1,164 @@
+import dataclasses
+import struct
+import zlib
+
+import pytest
+
+from checkpoint import *
+from memory import *
+from simulator import *
+
+
+SOURCE = [
+    'addi t0, zero, 0',
+    'addi t1, zero, 64',
+    'sw t0, 0(t0)',
+    'addi t0, t0, 4',
+    'bne t0, t1, -8',
+    'lw a0, 8(zero)',
+    'lb a1, 60(zero)',
+]
+
+
+def make_sim():
+    return Simulator(assemble(SOURCE), DataMemory(512, Cache(64, 16, 2, 'fifo'), page_size=32))
+
+
+def test_ckpt_restore_matches_full_run():
+    full = make_sim()
+    full.run()
+
+    sim = make_sim()
+    sim.run(max_steps=17)
+    ckpt = sim.checkpoint()
+
+    resumed = make_sim()
+    resumed.restore(loads(dumps(ckpt)))
+    resumed.run()
+    assert (resumed.pc, resumed.instret, resumed.x) == (full.pc, full.instret, full.x)
+    assert resumed.memory.freeze() == full.memory.freeze()
+    assert resumed.memory.cache.get_state() == full.memory.cache.get_state()
+    assert (resumed.memory.cache.hits, resumed.memory.cache.misses) == \
+        (full.memory.cache.hits, full.memory.cache.misses)
+
+
+def test_ckpt_copy_on_write():
+    sim = make_sim()
+    sim.run(max_steps=10)
+    ckpt = sim.checkpoint()
+    assert set(ckpt.pages) == {0}
+    assert sim.memory.pages[0] is ckpt.pages[0]
+
+    sim.run()
+    assert sim.memory.pages[0] is not ckpt.pages[0]
+    assert ckpt.pages[0][12:16] == bytes(4)
+    assert loads(dumps(ckpt)) == ckpt
+
+
+def test_ckpt_errors(tmp_path):
+    sim = make_sim()
+    ckpt = sim.checkpoint()
+    with pytest.raises(SimulatorError):
+        Simulator(assemble(['nop'])).restore(ckpt)
+
+    fname = str(tmp_path / 'sim.ckpt')
+    save_checkpoint(ckpt, fname)
+    assert load_checkpoint(fname) == ckpt
+    with pytest.raises(CheckpointError):
+        loads(dumps(ckpt)[:-4])
+    with pytest.raises(CheckpointError):
+        loads(b'RVCX' + dumps(ckpt)[4:])
+
+
+def test_ckpt_fast_forward():
+    full = CycleSimulator(assemble(SOURCE))
+    full.run()
+
+    sim = fast_forward(assemble(SOURCE), 40)
+    assert sim.instret == 40
+    assert sim.cycles == 0
+    sim.run()
+    assert sim.x == full.x
+    assert sim.cycles == full.cycles - 40 * CycleSimulator.stage_cycles
+
+
+def test_ckpt_restore_keeps_configuration():
+    # a checkpoint without a cache restored into a simulator with one
+    sim = Simulator(assemble(SOURCE), DataMemory(512))
+    sim.run(max_steps=17)
+    ckpt = sim.checkpoint()
+
+    cache = Cache(64, 16, 2)
+    resumed = Simulator(assemble(SOURCE), DataMemory(512, cache))
+    resumed.restore(ckpt)
+    assert resumed.memory.cache is cache
+    resumed.run()
+    assert cache.accesses > 0
+
+    detailed = fast_forward(assemble(SOURCE), 20, DataMemory(512, Cache(64, 16, 2)), ckpt)
+    assert detailed.memory.cache is not None
+
+
+def test_ckpt_restore_rejects_conflicts():
+    ckpt = make_sim().checkpoint()
+    with pytest.raises(CheckpointError):
+        Simulator(assemble(SOURCE), DataMemory(1024, Cache(64, 16, 2, 'fifo'))).restore(ckpt)
+    with pytest.raises(CheckpointError):
+        Simulator(assemble(SOURCE), DataMemory(512, Cache(128, 16, 2, 'fifo'))).restore(ckpt)
+    with pytest.raises(CheckpointError):
+        Simulator(assemble(SOURCE), DataMemory(512, Cache(64, 16, 2, 'lru'))).restore(ckpt)
+    with pytest.raises(CheckpointError):
+        Simulator(assemble(SOURCE), DataMemory(512)).restore(ckpt)
+    # without a memory configuration, fast_forward uses the checkpoint's
+    assert fast_forward(assemble(SOURCE), 20, start=ckpt).memory.cache is not None
+
+
+def test_ckpt_short_page():
+    sim = make_sim()
+    sim.run(max_steps=10)
+    data = dumps(sim.checkpoint())
+    body = zlib.decompress(data[6:])
+    page_end = 20 + 4 + 8 + 32 * 4 + 12 + 4 + 32
+    # the body ends part way through the only page
+    with pytest.raises(CheckpointError, match='truncated'):
+        loads(data[:6] + zlib.compress(body[:page_end - 1]))
+    # the page is one byte short, so the cache section is read out of step
+    with pytest.raises(CheckpointError):
+        loads(data[:6] + zlib.compress(body[:page_end - 1] + body[page_end:]))
+    with pytest.raises(CheckpointError, match='trailing'):
+        loads(data[:6] + zlib.compress(body + b'\0'))
+
+
+def test_ckpt_corrupt_cache():
+    data = dumps(make_sim().checkpoint())
+    body = zlib.decompress(data[6:])
+    cache_start = 20 + 4 + 8 + 32 * 4 + 12 + 4
+    header = struct.Struct('<IIIBIIQQQ')
+    fields = list(header.unpack_from(body, cache_start))
+
+    def patched(**changes):
+        names = ['size', 'line_size', 'ways']
+        new = list(fields)
+        for name, value in changes.items():
+            new[names.index(name)] = value
+        return data[:6] + zlib.compress(
+            body[:cache_start] + header.pack(*new) + body[cache_start + header.size:]
+        )
+
+    with pytest.raises(CheckpointError, match='invalid'):
+        loads(patched(size=48))
+    with pytest.raises(CheckpointError, match='invalid'):
+        loads(patched(line_size=2))
+    # same number of sets, but every set now claims to hold more lines than there are ways
+    set_start = cache_start + header.size
+    overfull = body[:set_start] + (struct.pack('<I', 3) + struct.pack('<3I', 1, 2, 3)) * 2
+    with pytest.raises(CheckpointError, match='2-way'):
+        loads(data[:6] + zlib.compress(overfull))
+
+    ckpt = make_sim().checkpoint()
+    bad = dataclasses.replace(ckpt.cache, ways=3)
+    with pytest.raises(CheckpointError):
+        restore_cache(bad)
+    bad = dataclasses.replace(ckpt.cache, sets=((1, 2, 3), ()))
+    with pytest.raises(CheckpointError):
+        restore_cache(bad)
@@ -0,0 +1,28 @@
+import pytest
+
+from assembler import *
+from disassembler import *
+
+
+def test_dec_round_trip():
+    source = [
+        'add a0, t0, t1',
+        'addi sp, sp, -16',
+        'srai t6, a0, 3',
+        'bne a0, zero, -8',
+        'lui a5, 74565',
+        'jal a7, 116088',
+    ]
+    for line in source:
+        inst = parse_line(line)[0]
+        assert decode(encode(inst)) == inst
+        assert format_instruction(inst) == line
+
+
+def test_dec_invalid():
+    with pytest.raises(AssemblerError):
+        decode(0)
+
+
+def test_dec_strip_padding():
+    assert disassemble([0x00628533, 0, 0]) == [Instruction('add', 10, 5, 6)]
@@ -0,0 +1,48 @@
+import pytest
+
+from memory import *
+
+
+def test_mem_load_store():
+    mem = DataMemory(16)
+    mem.store(4, 4, 0x80ff017f)
+    assert mem.load(4, 4) == 0x80ff017f
+    assert mem.load(4, 1, signed=True) == 0x7f
+    assert mem.load(6, 2, signed=True) == -0x7f01
+    assert mem.load(6, 2) == 0x80ff
+    mem.store(0, 1, -1)
+    assert mem.load(0, 1) == 0xff
+
+
+def test_mem_errors():
+    mem = DataMemory(16)
+    with pytest.raises(MemoryAccessError):
+        mem.load(2, 4)
+    with pytest.raises(MemoryAccessError):
+        mem.store(16, 1, 0)
+
+
+def test_cache_lru():
+    # 2 sets of 2 ways, lines 0, 2 and 4 all map to set 0
+    cache = Cache(size=64, line_size=16, ways=2, policy='lru')
+    for addr in (0, 32, 0, 64, 0, 32):
+        cache.access(addr)
+    assert (cache.hits, cache.misses, cache.evictions) == (2, 4, 2)
+    assert cache.hit_rate == pytest.approx(2 / 6)
+    assert cache.miss_penalty_cycles == 40
+
+
+def test_cache_fifo():
+    cache = Cache(size=64, line_size=16, ways=2, policy='fifo')
+    for addr in (0, 32, 0, 64, 0, 32):
+        cache.access(addr)
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 5, 3)
+
+
+def test_cache_invalid():
+    with pytest.raises(ValueError):
+        Cache(size=48)
+    with pytest.raises(ValueError):
+        Cache(size=16, line_size=16, ways=2)
+    with pytest.raises(ValueError):
+        Cache(size=64, line_size=2, ways=2)
@@ -0,0 +1,154 @@
+import os
+
+import pytest
+
+import preprocessor
+from preprocessor import *
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(preprocessor, 'cache_dir', str(tmp_path / 'cache'))
+    monkeypatch.setattr(preprocessor, '_file_cache', {})
+
+
+def run(source):
+    out = []
+    Preprocessor().process(source.splitlines(), out)
+    return out
+
+
+def test_pre_equ():
+    assert run('''
+        .equ STEP, 4
+        .equ NEG_STEP, -STEP
+        addi t0, t0, STEP
+        addi t1, t1, NEG_STEP  # comment
+    ''') == ['addi t0, t0, 4', 'addi t1, t1, -4']
+
+
+def test_pre_rept():
+    assert run('''
+        .rept 2
+        add a0, a0, t0
+        .rept 2
+        sub a0, a0, t1
+        .endr
+        .endr
+    ''') == ['add a0, a0, t0', 'sub a0, a0, t1', 'sub a0, a0, t1'] * 2
+
+
+def test_pre_rept_equ():
+    # the body redefines a symbol, so it must be expanded on every iteration
+    assert run('''
+        .equ N, 1
+        .rept 2
+        addi t0, t0, N
+        .equ N, 2
+        .endr
+    ''') == ['addi t0, t0, 1', 'addi t0, t0, 2']
+
+
+def test_pre_macro():
+    pp = Preprocessor()
+    out = []
+    pp.process('''
+        .macro inc reg, amount
+        addi \\reg, \\reg, \\amount
+        .endm
+        inc t0, 1
+        inc t0, 1
+        inc a0, -1
+    '''.splitlines(), out)
+    assert out == ['addi t0, t0, 1', 'addi t0, t0, 1', 'addi a0, a0, -1']
+
+    # a repeated invocation reuses the earlier expansion
+    assert pp.expand('inc', ('t0', '1')) is pp.expand('inc', ('t0', '1'))
+    assert pp.expand('inc', ('t0', '1')) is not pp.expand('inc', ('t0', '2'))
+
+
+def test_pre_macro_memo(monkeypatch):
+    pp = Preprocessor()
+    pp.process(['.macro inc reg', 'addi \\reg, \\reg, 1', '.endm'], [])
+    calls = []
+    process = pp._process
+    monkeypatch.setattr(pp, '_process', lambda *args: calls.append(args) or process(*args))
+
+    out = []
+    pp.process(['inc t0'] * 3 + ['inc a0'], out)
+    assert out == ['addi t0, t0, 1'] * 3 + ['addi a0, a0, 1']
+    # one call for the source itself, plus one per distinct expansion
+    assert len(calls) == 3
+
+    # redefining the macro invalidates earlier expansions
+    pp.process(['.macro inc reg', 'addi \\reg, \\reg, 2', '.endm'], [])
+    out = []
+    pp.process(['inc t0'], out)
+    assert out == ['addi t0, t0, 2']
+
+
+def test_pre_macro_errors():
+    with pytest.raises(PreprocessorError):
+        run('.macro inc reg\naddi \\reg, \\reg, 1\n.endm\ninc t0, t1')
+    with pytest.raises(PreprocessorError):
+        run('.macro loop\nloop\n.endm\nloop')
+    with pytest.raises(PreprocessorError):
+        run('.rept 2\nnop')
+    # empty arguments are allowed, and lines left blank by them are dropped
+    assert run('.macro m a, b\n\\b\n\\a\n.endm\nm nop,') == ['nop']
+
+
+def test_pre_include(tmp_path):
+    (tmp_path / 'defs.s').write_text('.equ STEP, 8\n.macro bump reg\naddi \\reg, \\reg, STEP\n.endm\n')
+    (tmp_path / 'main.s').write_text('.include "defs.s"\nbump sp\n')
+    assert preprocess_file(str(tmp_path / 'main.s')) == ['addi sp, sp, 8']
+
+    (tmp_path / 'loop.s').write_text('.include "loop.s"\n')
+    with pytest.raises(PreprocessorError):
+        preprocess_file(str(tmp_path / 'loop.s'))
+
+
+def test_pre_macro_include_dir(tmp_path):
+    # .include inside a macro body resolves against the calling file
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'part.s').write_text('nop\n')
+    (tmp_path / 'sub' / 'part.s').write_text('ret\n')
+    (tmp_path / 'defs.s').write_text('.macro pull\n.include "part.s"\n.endm\n')
+    (tmp_path / 'sub' / 'x.s').write_text('pull\n')
+    (tmp_path / 'main.s').write_text('.include "defs.s"\n.include "sub/x.s"\npull\n')
+    assert preprocess_file(str(tmp_path / 'main.s')) == ['ret', 'nop']
+
+
+def test_pre_include_cache(tmp_path):
+    fname = tmp_path / 'defs.s'
+    fname.write_text('nop\n')
+    lines = read_source(str(fname))
+    assert read_source(str(fname)) is lines
+
+    # touching the file without changing it keeps the parsed lines
+    st = os.stat(fname)
+    os.utime(fname, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    assert read_source(str(fname)) is lines
+
+    fname.write_text('ret\nnop\n')
+    assert read_source(str(fname)) == ('ret', 'nop')
+
+
+def test_pre_include_disk_cache(tmp_path, monkeypatch):
+    fname = tmp_path / 'defs.s'
+    fname.write_text('nop  # comment\n\nret\n')
+    assert read_source(str(fname)) == ('nop', 'ret')
+
+    # a new process starts with an empty in-memory cache, but the lines are
+    # read back from disk without tokenizing the source again
+    def fail(lines):
+        raise AssertionError('source was tokenized again')
+    monkeypatch.setattr(preprocessor, '_file_cache', {})
+    monkeypatch.setattr(preprocessor, 'clean_lines', fail)
+    assert read_source(str(fname)) == ('nop', 'ret')
+    assert preprocess_file(str(fname)) == ['nop', 'ret']
+
+    monkeypatch.setattr(preprocessor, 'cache_dir', None)
+    monkeypatch.setattr(preprocessor, '_file_cache', {})
+    with pytest.raises(AssertionError):
+        read_source(str(fname))
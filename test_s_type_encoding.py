@@ -5,12 +5,28 @@ from assembler import *
 
 
 def test_enc_rv32i_sb():
-    pass
+    # sb a0, -1(s0)
+    encoding: BitArray = build_s_type('sb', 's0', 'a0', -1)
+    val: int = bit_array_to_int(encoding)
+    assert val == 0b11111110101001000000111110100011
 
 
 def test_enc_rv32i_sh():
-    pass
+    # sh a1, 2(a0)
+    encoding: BitArray = build_s_type('sh', 'a0', 'a1', 2)
+    val: int = bit_array_to_int(encoding)
+    assert val == 0b00000000101101010001000100100011
 
 
 def test_enc_rv32i_sw():
-    pass
+    # sw t0, 8(sp)
+    encoding: BitArray = build_s_type('sw', 'sp', 't0', 8)
+    val: int = bit_array_to_int(encoding)
+    assert val == 0b00000000010100010010010000100011
+    assert parse_line('sw t0, 8(sp)') == [Instruction('sw', rs1=2, rs2=5, imm=8)]
+
+
+def test_enc_rv32i_s_imm_range():
+    build_s_type('sw', 'sp', 't0', -2048)
+    with pytest.raises(AssemblerError):
+        build_s_type('sw', 'sp', 't0', 2048)
@@ -0,0 +1,122 @@
+import os
+
+import pytest
+
+from assembler import *
+from memory import *
+from disassembler import decode_words, read_mem
+from simulator import *
+
+
+def test_sim_reset():
+    sim = Simulator([])
+    assert sim.x == [0] + list(range(1, 32))
+
+
+def test_sim_loop():
+    # sum the numbers 1 through 5 into a0
+    sim = Simulator(assemble([
+        'addi a0, zero, 0',
+        'addi t0, zero, 5',
+        'add a0, a0, t0',
+        'addi t0, t0, -1',
+        'bnez t0, -8',
+    ]))
+    sim.run()
+    assert sim.x[10] == 15
+    assert sim.x[5] == 0
+
+
+def test_sim_signed():
+    sim = Simulator(assemble([
+        'addi t0, zero, -1',
+        'slt t1, t0, zero',
+        'sltu t2, t0, zero',
+        'srai t3, t0, 4',
+    ]))
+    sim.run()
+    assert sim.x[5] == 0xffffffff
+    assert sim.x[6] == 1
+    assert sim.x[7] == 0
+    assert sim.x[28] == 0xffffffff
+
+
+def test_sim_jal():
+    sim = Simulator(assemble([
+        'jal ra, 8',
+        'addi a0, zero, 1',
+        'addi a1, zero, 2',
+    ]))
+    sim.run()
+    assert sim.x[1] == 4
+    assert sim.x[10] == 10
+    assert sim.x[11] == 2
+
+
+def test_sim_load_store():
+    cache = Cache(size=64, line_size=16, ways=1)
+    sim = Simulator(assemble([
+        'addi t0, zero, -2',
+        'sw t0, 16(zero)',
+        'lh a0, 18(zero)',
+        'lhu a1, 16(zero)',
+        'lb a2, 16(zero)',
+        'lbu a3, 17(zero)',
+    ]), DataMemory(64, cache))
+    sim.run()
+    assert sim.x[10] == 0xffffffff
+    assert sim.x[11] == 0xfffe
+    assert sim.x[12] == 0xfffffffe
+    assert sim.x[13] == 0xff
+    assert (cache.hits, cache.misses) == (4, 1)
+
+
+def test_sim_week2_demo(capsys):
+    # the demo starts with an all-zero word, which decode.v treats as a nop
+    fname = os.path.join(os.path.dirname(__file__), 'week2_demo.mem')
+    sim = Simulator(decode_words(read_mem(fname)))
+    assert sim.run() == 7
+    assert sim.x[31] == 8 >> 2
+
+    main([fname])
+    assert 'x31 = 0x00000002' in capsys.readouterr().out
+
+
+def test_sim_invalid_word():
+    sim = Simulator([Instruction('addi', 5, 0, imm=1), 0xffffffff])
+    sim.step()
+    with pytest.raises(SimulatorError):
+        sim.step()
+
+
+def test_sim_cli_errors(tmp_path, capsys):
+    fname = tmp_path / 'store.s'
+    fname.write_text('addi t0, zero, 16\nsw t0, 0(t0)\n')
+
+    with pytest.raises(SystemExit):
+        main([str(fname), '--cache', '48', '16', '2'])
+    assert '--cache: ' in capsys.readouterr().err
+
+    with pytest.raises(SystemExit):
+        main([str(fname), '--mem-size', '16'])
+    assert 'pc=0x00000004: addr=0x00000010 is outside of data memory' in capsys.readouterr().err
+
+
+def test_sim_cli_restore_cache_options(tmp_path, capsys):
+    fname = tmp_path / 'store.s'
+    fname.write_text('addi t0, zero, 0\naddi t1, zero, 64\nsw t0, 0(t0)\naddi t0, t0, 4\nbne t0, t1, -8\n')
+    ckpt = str(tmp_path / 'k.ck')
+    main([str(fname), '--cache', '64', '16', '2', '--max-steps', '12', '--save', ckpt])
+    capsys.readouterr()
+
+    # the restored cache takes an explicit miss penalty
+    main([str(fname), '--restore', ckpt, '--miss-penalty', '100'])
+    assert '4 misses (75.00% hit rate), 400 miss penalty cycles' in capsys.readouterr().out
+
+    with pytest.raises(SystemExit):
+        main([str(fname), '--restore', ckpt, '--policy', 'fifo'])
+    assert "--policy fifo conflicts with the checkpoint's lru cache" in capsys.readouterr().err
+
+    with pytest.raises(SystemExit):
+        main([str(fname), '--miss-penalty', '100'])
+    assert 'need a data cache' in capsys.readouterr().err
@@ -10,3 +10,11 @@ def test_enc_rv32i_lui():
 
 def test_enc_rv32i_auipc():
     pass
+
+
+def test_enc_rv32i_u_imm_range():
+    assert build_u_type('lui', 'a0', -1) == build_u_type('lui', 'a0', 0xfffff)
+    with pytest.raises(AssemblerError):
+        build_u_type('lui', 'a0', 0x100000)
+    with pytest.raises(AssemblerError):
+        build_u_type('auipc', 'a0', -0x80001)